@@ -2,19 +2,33 @@ from sentence_transformers import SentenceTransformer
 import faiss
 import numpy as np
 import os
+import threading
 import json
+import logging
+from collections import OrderedDict
 from typing import List, Dict
 
+import metrics
+
+logger = logging.getLogger(__name__)
+
 #Configuration
 EMBEDDING_MODEL_NAME = 'all-MiniLM-L6-v2' #A small fast model for embeddings
 FAISS_INDEX_PATH = 'faiss_index.bin'
 PRODUCT_METADATA_PATH = 'product_metadata.json'
+QUERY_EMBEDDING_CACHE_SIZE = 1024 # Repeated search queries skip the model encode
 
 class AIService:
     _instance = None # Singleton instance
     _model = None
     _index = None
     _product_data = None # Store product_id -> metadata for FAISS lookup
+    _query_cache = None # query text -> embedding (LRU)
+    # Locking: searches take only _lock, held briefly. Writers (add + save) hold _write_lock for their whole
+    # run and _lock only around the in-memory mutation, so a save reads the index without blocking searches.
+    _lock = threading.RLock() # Guards _index/_product_data between searches and the index mutation
+    _write_lock = threading.RLock() # Serializes index mutation and disk writes (the background index worker)
+    _dirty = False # In-memory index has changes not yet written to disk
 
     def __new__(cls):
         if cls._instance is None:
@@ -25,29 +39,65 @@ class AIService:
     def initialize(self):
         """Initializes the model and FAISS index, loading from disk if available."""
         if not self._model:
-            print(f"Loading embedding model: {EMBEDDING_MODEL_NAME}...")
+            logger.info("Loading embedding model: %s...", EMBEDDING_MODEL_NAME)
             # Load model only once
             self._model = SentenceTransformer(EMBEDDING_MODEL_NAME)
-            print("Embedding model loaded.")
+            logger.info("Embedding model loaded.")
+
+        if self._query_cache is None:
+            self._query_cache = OrderedDict()
 
         if not self._index or not self._product_data:
             if os.path.exists(FAISS_INDEX_PATH) and os.path.exists(PRODUCT_METADATA_PATH):
-                print(f"Loading FAISS index from {FAISS_INDEX_PATH} and metadata from {PRODUCT_METADATA_PATH}...")
+                logger.info("Loading FAISS index from %s and metadata from %s...", FAISS_INDEX_PATH, PRODUCT_METADATA_PATH)
                 self._index = faiss.read_index(FAISS_INDEX_PATH)
                 with open(PRODUCT_METADATA_PATH, 'r') as f:
                     self._product_data = json.load(f)
-                print("FAISS index and metadata loaded.")
+                self._reconcile_loaded_index()
+                logger.info("FAISS index and metadata loaded.")
             else:
-                print("No existing FAISS index found. It will be built upon first product update.")
+                logger.info("No existing FAISS index found. It will be built upon first product update.")
                 self._product_data = {} # Initialize empty metadata
+        metrics.INDEX_SIZE.set(self._index.ntotal if self._index is not None else 0)
+
+    def _reconcile_loaded_index(self):
+        """
+        Trims the loaded index and metadata to their common length.
+        The two files are renamed one after the other, so a crash or failed write between the renames
+        leaves one of them ahead. Both grow by appending in the same order, so the shorter one is a
+        consistent prefix; the trimmed products still have outbox rows and are re-indexed on replay.
+        """
+        n = min(self._index.ntotal, len(self._product_data))
+        if self._index.ntotal == len(self._product_data):
+            return
+        logger.warning(
+            "FAISS index (%d vectors) and metadata (%d products) are out of sync; trimming both to %d.",
+            self._index.ntotal, len(self._product_data), n,
+        )
+        if self._index.ntotal > n:
+            self._index.remove_ids(faiss.IDSelectorRange(n, self._index.ntotal))
+        if len(self._product_data) > n:
+            self._product_data = dict(list(self._product_data.items())[:n])
+        self._dirty = True
 
     def get_embedding(self, text: str) -> np.ndarray:
         """Generates an embedding for the given text."""
         # Ensure model is loaded (it should be by initialize())
         if not self._model:
             self.initialize()
-        embedding = self._model.encode(text, convert_to_tensor=False)
-        return embedding.astype('float32') # FAISS expects float32
+        cached = self._query_cache.get(text)
+        if cached is not None:
+            self._query_cache.move_to_end(text)
+            metrics.CACHE_HITS.inc(cache="query_embedding")
+            return cached
+        metrics.CACHE_MISSES.inc(cache="query_embedding")
+        with metrics.stage("encode"):
+            embedding = self._model.encode(text, convert_to_tensor=False)
+        embedding = embedding.astype('float32') # FAISS expects float32
+        self._query_cache[text] = embedding
+        if len(self._query_cache) > QUERY_EMBEDDING_CACHE_SIZE:
+            self._query_cache.popitem(last=False)
+        return embedding
 
     def add_products_to_index(self, products: List[Dict]):
         """Adds or updates product embeddings in the FAISS index."""
@@ -68,48 +118,66 @@ class AIService:
         if not texts: # No products to process
             return
 
-        print(f"Generating embeddings for {len(texts)} products...")
-        embeddings = self._model.encode(texts, convert_to_tensor=False)
+        logger.debug("Generating embeddings for %d products...", len(texts))
+        with metrics.stage("index_encode"): # batch encodes from the index worker, not the request path
+            embeddings = self._model.encode(texts, convert_to_tensor=False)
         embeddings = embeddings.astype('float32')
 
-        if self._index is None:
-            # Initialize FAISS index if it's the first time
-            dimension = embeddings.shape[1]
-            self._index = faiss.IndexFlatL2(dimension) # L2 for Euclidean distance
-            print(f"Initialized FAISS index with dimension: {dimension}")
-
-        # Add vectors to the index. Map FAISS internal IDs to your product IDs.
-        # This is a simple append. For updates/deletions, a more complex index structure (e.g., IndexIDMap)
-        # or re-building would be needed. For a demo, append is fine.
-        current_product_ids_in_index = set(self._product_data.keys())
-        new_embeddings = []
-        new_product_metadata = {}
-
-        for i, p_id in enumerate(product_ids):
-            if str(p_id) not in current_product_ids_in_index:
-                new_embeddings.append(embeddings[i])
-                new_product_metadata[str(p_id)] = products[i] # Store full product dict
-
-        if new_embeddings:
-            self._index.add(np.array(new_embeddings))
-            self._product_data.update(new_product_metadata)
-            print(f"Added {len(new_embeddings)} new products to FAISS index.")
-            self.save_index()
-        else:
-            print("No new products to add to FAISS index.")
+        with self._write_lock:
+            # Only the in-memory mutation blocks searches; the slow encode above and the save below don't
+            with self._lock:
+                if self._index is None:
+                    # Initialize FAISS index if it's the first time
+                    dimension = embeddings.shape[1]
+                    self._index = faiss.IndexFlatL2(dimension) # L2 for Euclidean distance
+                    logger.info("Initialized FAISS index with dimension: %d", dimension)
+
+                # Add vectors to the index. Map FAISS internal IDs to your product IDs.
+                # This is a simple append. For updates/deletions, a more complex index structure (e.g., IndexIDMap)
+                # or re-building would be needed. For a demo, append is fine.
+                current_product_ids_in_index = set(self._product_data.keys())
+                new_embeddings = []
+                new_product_metadata = {}
+
+                for i, p_id in enumerate(product_ids):
+                    if str(p_id) not in current_product_ids_in_index:
+                        new_embeddings.append(embeddings[i])
+                        new_product_metadata[str(p_id)] = products[i] # Store full product dict
+
+                if new_embeddings:
+                    self._index.add(np.array(new_embeddings))
+                    self._product_data.update(new_product_metadata)
+                    metrics.INDEX_SIZE.set(self._index.ntotal)
+                    self._dirty = True
+                    logger.debug("Added %d new products to FAISS index.", len(new_embeddings))
+                else:
+                    logger.debug("No new products to add to FAISS index.")
+
+            # Save whenever the disk copy is stale, not only when this call added vectors: a retry after a
+            # failed save finds every id already indexed and must still persist them
+            if self._dirty:
+                self.save_index()
 
 
     def search_products(self, query_text: str, k: int = 5) -> List[Dict]:
         """Searches for products similar to the query text."""
         if not self._model or not self._index or not self._product_data:
-            print("AI Service not fully initialized. Cannot search.")
+            logger.warning("AI Service not fully initialized. Cannot search.")
             return []
 
         query_embedding = self.get_embedding(query_text).reshape(1, -1) # Reshape for FAISS
-        D, I = self._index.search(query_embedding, k) # D=distances, I=indices
+        with self._lock:
+            with metrics.stage("faiss_search"):
+                D, I = self._index.search(query_embedding, k) # D=distances, I=indices
+
+            with metrics.stage("metadata_resolve"):
+                return self._resolve_metadata(I[0])
 
+    def _resolve_metadata(self, indices) -> List[Dict]:
+        """Maps FAISS internal positions back to stored product metadata."""
+        product_ids = list(self._product_data.keys()) # Built once per search, not once per hit
         results = []
-        for idx in I[0]:
+        for idx in indices:
             if idx == -1: # FAISS returns -1 for unpopulated slots if k > num_vectors
                 continue
             # Find the corresponding product ID from our stored metadata
@@ -119,21 +187,33 @@ class AIService:
             # A more robust solution for real apps uses IndexIDMap.
             # For now, we'll iterate product_data to find by index
             # This is inefficient for large data; for production, use IndexIDMap.
-            product_id_found = list(self._product_data.keys())[idx]
+            product_id_found = product_ids[idx]
             results.append(self._product_data[product_id_found])
 
         return results
 
 
     def save_index(self):
-        """Saves the FAISS index and product metadata to disk."""
-        if self._index:
-            faiss.write_index(self._index, FAISS_INDEX_PATH)
-            print(f"FAISS index saved to {FAISS_INDEX_PATH}")
-        if self._product_data:
-            with open(PRODUCT_METADATA_PATH, 'w') as f:
-                json.dump(self._product_data, f)
-            print(f"Product metadata saved to {PRODUCT_METADATA_PATH}")
+        """Saves the FAISS index and product metadata to disk. Raises if the write fails."""
+        # Holding _write_lock keeps the index from changing while it is written; searches only read it
+        # and take _lock, so they are not blocked by the file I/O
+        with self._write_lock, metrics.stage("index_save"):
+            # Write both files under per-process temp names, then rename each so a crash mid-write never
+            # leaves a truncated file. A crash between the two renames is repaired on load by
+            # _reconcile_loaded_index.
+            suffix = f'.{os.getpid()}.tmp'
+            if self._index:
+                faiss.write_index(self._index, FAISS_INDEX_PATH + suffix)
+            if self._product_data:
+                with open(PRODUCT_METADATA_PATH + suffix, 'w') as f:
+                    json.dump(self._product_data, f)
+            if self._index:
+                os.replace(FAISS_INDEX_PATH + suffix, FAISS_INDEX_PATH)
+                logger.debug("FAISS index saved to %s", FAISS_INDEX_PATH)
+            if self._product_data:
+                os.replace(PRODUCT_METADATA_PATH + suffix, PRODUCT_METADATA_PATH)
+                logger.debug("Product metadata saved to %s", PRODUCT_METADATA_PATH)
+            self._dirty = False
 
 # Instantiate the AI Service as a singleton
 ai_service = AIService()
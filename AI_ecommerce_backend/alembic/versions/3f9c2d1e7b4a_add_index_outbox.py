@@ -0,0 +1,44 @@
+"""Add index outbox table
+
+Revision ID: 3f9c2d1e7b4a
+Revises: aa61c31b7caf
+Create Date: 2026-10-19 10:12:41.208113
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3f9c2d1e7b4a'
+down_revision: Union[str, Sequence[str], None] = 'aa61c31b7caf'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'index_outbox',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('product_id', sa.Integer(), nullable=True),
+        sa.Column('created_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.Column('attempts', sa.Integer(), server_default='0', nullable=True),
+        sa.Column('next_attempt_at', sa.DateTime(), server_default=sa.func.now(), nullable=True),
+        sa.Column('last_error', sa.Text(), nullable=True),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('id'),
+    )
+    op.create_index(op.f('ix_index_outbox_id'), 'index_outbox', ['id'], unique=False)
+    op.create_index(op.f('ix_index_outbox_product_id'), 'index_outbox', ['product_id'], unique=False)
+    op.create_index(op.f('ix_index_outbox_next_attempt_at'), 'index_outbox', ['next_attempt_at'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index(op.f('ix_index_outbox_next_attempt_at'), table_name='index_outbox')
+    op.drop_index(op.f('ix_index_outbox_product_id'), table_name='index_outbox')
+    op.drop_index(op.f('ix_index_outbox_id'), table_name='index_outbox')
+    op.drop_table('index_outbox')
@@ -0,0 +1,54 @@
+"""Add sales rollup tables
+
+Revision ID: 8d41b6a0c2f5
+Revises: 3f9c2d1e7b4a
+Create Date: 2026-10-19 11:03:27.594310
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '8d41b6a0c2f5'
+down_revision: Union[str, Sequence[str], None] = '3f9c2d1e7b4a'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    op.create_table(
+        'sales_by_product',
+        sa.Column('product_id', sa.Integer(), nullable=False),
+        sa.Column('units', sa.Integer(), server_default='0', nullable=True),
+        sa.Column('revenue', sa.Float(), server_default='0', nullable=True),
+        sa.ForeignKeyConstraint(['product_id'], ['products.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint('product_id'),
+    )
+    op.create_index(op.f('ix_sales_by_product_revenue'), 'sales_by_product', ['revenue'], unique=False)
+    op.create_table(
+        'sales_by_category',
+        sa.Column('category', sa.String(), nullable=False),
+        sa.Column('units', sa.Integer(), server_default='0', nullable=True),
+        sa.Column('revenue', sa.Float(), server_default='0', nullable=True),
+        sa.PrimaryKeyConstraint('category'),
+    )
+    op.create_table(
+        'sales_by_day',
+        sa.Column('day', sa.Date(), nullable=False),
+        sa.Column('units', sa.Integer(), server_default='0', nullable=True),
+        sa.Column('revenue', sa.Float(), server_default='0', nullable=True),
+        sa.PrimaryKeyConstraint('day'),
+    )
+    # Populate the rollups from existing orders afterwards with: python analytics.py
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_table('sales_by_day')
+    op.drop_table('sales_by_category')
+    op.drop_index(op.f('ix_sales_by_product_revenue'), table_name='sales_by_product')
+    op.drop_table('sales_by_product')
@@ -0,0 +1,183 @@
+import logging
+from datetime import date
+from typing import Dict, Iterable, Tuple
+
+import numpy as np
+from sqlalchemy import func, literal_column, select, text
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.orm import Session
+
+from database import database, models
+
+logger = logging.getLogger(__name__)
+
+#Configuration
+BACKFILL_CHUNK_SIZE = 50_000 # order_items rows pulled per round trip from the server-side cursor
+UPSERT_BATCH_SIZE = 5_000 # rows per INSERT, well under PostgreSQL's bind-parameter limit
+BACKFILL_INFLIGHT_WINDOW = 100_000 # ids below the watermark rechecked for transactions still open at snapshot time
+UNCATEGORIZED = "Uncategorized" # rollup key for products with a NULL or empty category
+
+
+def _upsert(db: Session, model, key: str, rows: Dict):
+    """Adds units/revenue to rollup rows, inserting missing keys (INSERT ... ON CONFLICT DO UPDATE)."""
+    # PostgreSQL locks conflicting rows in VALUES order; a fixed key order keeps concurrent orders
+    # touching the same products from deadlocking each other
+    values = [{key: k, "units": units, "revenue": revenue} for k, (units, revenue) in sorted(rows.items())]
+    for start in range(0, len(values), UPSERT_BATCH_SIZE):
+        stmt = insert(model).values(values[start:start + UPSERT_BATCH_SIZE])
+        stmt = stmt.on_conflict_do_update(
+            index_elements=[key],
+            set_={
+                "units": model.units + stmt.excluded.units,
+                "revenue": model.revenue + stmt.excluded.revenue,
+            },
+        )
+        db.execute(stmt)
+
+
+def _accumulate(totals: Dict, k, units, revenue):
+    prev_units, prev_revenue = totals.get(k, (0, 0.0))
+    totals[k] = (prev_units + units, prev_revenue + revenue)
+
+
+def record_order(db: Session, items: Iterable[Tuple[models.OrderItem, models.Product]]):
+    """
+    Folds a new order into the sales rollups.
+    Must run in the same transaction as the order insert so the rollups never drift from order_items;
+    CURRENT_DATE then matches the date of the order's now() default.
+    """
+    by_product, by_category = {}, {}
+    day_units, day_revenue = 0, 0.0
+    for item, product in items:
+        revenue = item.quantity * item.price_at_purchase
+        # Coalesce duplicate keys first: ON CONFLICT cannot touch the same row twice in one statement
+        _accumulate(by_product, product.id, item.quantity, revenue)
+        # Same rule as the backfill's coalesce(nullif(category, ''), ...): NULL and "" are both uncategorized
+        _accumulate(by_category, product.category or UNCATEGORIZED, item.quantity, revenue)
+        day_units += item.quantity
+        day_revenue += revenue
+
+    _upsert(db, models.SalesByProduct, "product_id", by_product)
+    _upsert(db, models.SalesByCategory, "category", by_category)
+    if day_units:
+        _upsert(db, models.SalesByDay, "day", {func.current_date(): (day_units, day_revenue)})
+
+
+def _group_sum(keys: np.ndarray, units: np.ndarray, revenue: np.ndarray):
+    """Vectorized GROUP BY key, SUM(units), SUM(revenue) over one chunk."""
+    uniq, inverse = np.unique(keys, return_inverse=True)
+    return (
+        uniq,
+        np.bincount(inverse, weights=units, minlength=len(uniq)),
+        np.bincount(inverse, weights=revenue, minlength=len(uniq)),
+    )
+
+
+def _merge(totals: Dict, uniq, units, revenue, decode=None):
+    for k, u, r in zip(uniq.tolist(), units.tolist(), revenue.tolist()):
+        _accumulate(totals, decode(k) if decode else k, int(u), r)
+
+
+class _Totals:
+    """Running per-product/category/day sums fed by vectorized chunk aggregation."""
+
+    def __init__(self):
+        self.by_product, self.by_category, self.by_day = {}, {}, {}
+        self.rows_seen = 0
+        self._category_codes: Dict[str, int] = {}
+        self._category_names = []
+
+    def add_rows(self, chunk):
+        """chunk: rows of (product_id, category, day, quantity, price_at_purchase)."""
+        n = len(chunk)
+        if not n:
+            return
+        self.rows_seen += n
+        codes = self._category_codes
+        product_ids = np.fromiter((r[0] for r in chunk), dtype=np.int64, count=n)
+        categories = np.fromiter((codes.setdefault(r[1], len(codes)) for r in chunk), dtype=np.int64, count=n)
+        days = np.fromiter((r[2].toordinal() for r in chunk), dtype=np.int64, count=n)
+        units = np.fromiter((r[3] or 0 for r in chunk), dtype=np.float64, count=n)
+        prices = np.fromiter((r[4] or 0.0 for r in chunk), dtype=np.float64, count=n)
+        revenue = units * prices
+        self._category_names.extend(list(codes)[len(self._category_names):])
+
+        _merge(self.by_product, *_group_sum(product_ids, units, revenue))
+        _merge(self.by_category, *_group_sum(categories, units, revenue), decode=self._category_names.__getitem__)
+        _merge(self.by_day, *_group_sum(days, units, revenue), decode=date.fromordinal)
+
+
+def _items_query():
+    return (
+        select(
+            models.OrderItem.product_id,
+            func.coalesce(func.nullif(models.Product.category, ""), UNCATEGORIZED),
+            func.date(models.Order.order_date),
+            models.OrderItem.quantity,
+            models.OrderItem.price_at_purchase,
+        )
+        .join(models.Order, models.OrderItem.order_id == models.Order.id)
+        .join(models.Product, models.OrderItem.product_id == models.Product.id)
+    )
+
+
+def backfill(db: Session):
+    """
+    Rebuilds every rollup table from the full order history while the API keeps taking orders.
+
+    1. Without any lock, in one REPEATABLE READ snapshot, read the watermark max(order_items.id)
+       and stream every item up to it from a server-side cursor, aggregating chunk by chunk with
+       numpy (memory stays bounded by BACKFILL_CHUNK_SIZE and the number of distinct keys).
+    2. Lock the rollup tables, fold in the items the snapshot could not see, and swap the rows.
+       create_order only waits on its upsert for this short second phase.
+    Requires PostgreSQL 13+ (pg_current_snapshot).
+    """
+    totals = _Totals()
+
+    # Phase 1: full-history scan, no locks held
+    db.connection(execution_options={"isolation_level": "REPEATABLE READ"})
+    watermark, inflight_xids = db.execute(text(
+        "SELECT (SELECT coalesce(max(id), 0) FROM order_items),"
+        " ARRAY(SELECT x::text::bigint % 4294967296 FROM pg_snapshot_xip(pg_current_snapshot()) AS x)"
+    )).one()
+    stmt = _items_query().where(models.OrderItem.id <= watermark)
+    for chunk in db.execute(stmt.execution_options(yield_per=BACKFILL_CHUNK_SIZE)).partitions():
+        totals.add_rows(chunk)
+    db.commit()
+    logger.info("Aggregated %d order items up to id %d; swapping in rollups.", totals.rows_seen, watermark)
+
+    # Phase 2: short critical section. EXCLUSIVE waits for in-flight create_order upserts to commit and
+    # blocks new ones until we do, so every order is counted exactly once (reads are not blocked)
+    for model in (models.SalesByProduct, models.SalesByCategory, models.SalesByDay):
+        db.execute(text(f"LOCK TABLE {model.__tablename__} IN EXCLUSIVE MODE"))
+    # Items committed after the watermark...
+    totals.add_rows(db.execute(_items_query().where(models.OrderItem.id > watermark)).all())
+    # ...and items below it whose transaction was still open when the snapshot was taken. create_order
+    # transactions are short, so their ids sit just below the watermark and an id-bounded scan suffices
+    if inflight_xids:
+        late = _items_query().where(
+            models.OrderItem.id <= watermark,
+            models.OrderItem.id > watermark - BACKFILL_INFLIGHT_WINDOW,
+            literal_column("order_items.xmin::text::bigint").in_(inflight_xids),
+        )
+        totals.add_rows(db.execute(late).all())
+
+    for model in (models.SalesByProduct, models.SalesByCategory, models.SalesByDay):
+        db.query(model).delete()
+    _upsert(db, models.SalesByProduct, "product_id", totals.by_product)
+    _upsert(db, models.SalesByCategory, "category", totals.by_category)
+    _upsert(db, models.SalesByDay, "day", totals.by_day)
+    db.commit()
+    logger.info(
+        "Sales rollups rebuilt from %d order items (%d products, %d categories, %d days).",
+        totals.rows_seen, len(totals.by_product), len(totals.by_category), len(totals.by_day),
+    )
+
+
+if __name__ == "__main__":
+    logging.basicConfig(level=logging.INFO)
+    db = database.SessionLocal()
+    try:
+        backfill(db)
+    finally:
+        db.close()
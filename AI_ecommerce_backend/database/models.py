@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime
+from sqlalchemy import Column, Integer, String, Float, ForeignKey, DateTime, Date, Text
 from .database import Base
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
@@ -55,4 +55,44 @@ class OrderItem(Base):
 
     #Relationships
     order = relationship("Order", back_populates="items")
-    product = relationship("Product", back_populates="order_items")
\ No newline at end of file
+    product = relationship("Product", back_populates="order_items")
+
+# Transactional outbox for AI index updates.
+# A row is written in the same transaction as the product, and the background
+# index worker (index_worker.py) drains it into the FAISS index.
+class IndexOutbox(Base):
+    __tablename__ = "index_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), index=True)
+    created_at = Column(DateTime, default=func.now())
+    attempts = Column(Integer, default=0)
+    next_attempt_at = Column(DateTime, default=func.now(), index=True)
+    last_error = Column(Text, nullable=True)
+
+    #Relationship
+    product = relationship("Product")
+
+
+# Sales rollups, kept up to date incrementally by create_order (see analytics.py)
+# so dashboard reads never scan orders/order_items.
+class SalesByProduct(Base):
+    __tablename__ = "sales_by_product"
+
+    product_id = Column(Integer, ForeignKey("products.id", ondelete="CASCADE"), primary_key=True)
+    units = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0, index=True)
+
+class SalesByCategory(Base):
+    __tablename__ = "sales_by_category"
+
+    category = Column(String, primary_key=True)
+    units = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)
+
+class SalesByDay(Base):
+    __tablename__ = "sales_by_day"
+
+    day = Column(Date, primary_key=True)
+    units = Column(Integer, default=0)
+    revenue = Column(Float, default=0.0)
@@ -0,0 +1,147 @@
+import logging
+import os
+import threading
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from database import database, models
+from ai_service import ai_service
+import metrics
+
+logger = logging.getLogger(__name__)
+
+#Configuration
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "256"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "1.0")) # seconds between polls when idle
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8")) # rows beyond this are parked for inspection
+OUTBOX_BACKOFF_BASE = 2.0 # seconds, doubled on each failed attempt
+# The FAISS index lives in process memory and is saved over one shared file, so exactly one process
+# may run the worker. Run the API with a single process, or set this to 0 on all but one of them
+# (the others only see new products after a restart).
+INDEX_WORKER_ENABLED = os.getenv("INDEX_WORKER_ENABLED", "1") == "1"
+
+OUTBOX_LAG = metrics.registry.register(metrics.Gauge(
+    "index_outbox_lag_seconds", "Age of the oldest pending index outbox entry."))
+OUTBOX_PENDING = metrics.registry.register(metrics.Gauge(
+    "index_outbox_pending", "Number of pending index outbox entries."))
+OUTBOX_PARKED = metrics.registry.register(metrics.Gauge(
+    "index_outbox_parked", "Index outbox entries that exhausted OUTBOX_MAX_ATTEMPTS and need inspection."))
+OUTBOX_PROCESSED = metrics.registry.register(metrics.Counter(
+    "index_outbox_processed_total", "Index outbox entries processed, by result."))
+
+
+class IndexWorker:
+    """Background thread draining the index outbox into the AI service in batches."""
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not INDEX_WORKER_ENABLED:
+            logger.info("Index outbox worker disabled in this process (INDEX_WORKER_ENABLED=0).")
+            return
+        if self._thread is not None and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="index-outbox-worker", daemon=True)
+        self._thread.start()
+
+    def stop(self, timeout: float = 5.0):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                with metrics.background():
+                    drained = self.drain_once()
+            except Exception:
+                logger.exception("Index outbox drain failed")
+                drained = 0
+            # Keep draining while batches come back full, otherwise wait for the next poll
+            if drained < OUTBOX_BATCH_SIZE:
+                self._stop.wait(OUTBOX_POLL_INTERVAL)
+
+    def drain_once(self) -> int:
+        """Processes one batch of due outbox rows. Returns the number of rows claimed."""
+        db = database.SessionLocal()
+        try:
+            # FOR UPDATE locks the claimed rows until commit; SKIP LOCKED avoids waiting on rows a previous
+            # process still holds during a rolling restart. It does not make several concurrent workers
+            # safe: each would index its own subset in memory and overwrite the shared index file.
+            rows = (
+                db.query(models.IndexOutbox)
+                .filter(models.IndexOutbox.attempts < OUTBOX_MAX_ATTEMPTS)
+                .filter(models.IndexOutbox.next_attempt_at <= func.now())
+                .order_by(models.IndexOutbox.id)
+                .limit(OUTBOX_BATCH_SIZE)
+                .with_for_update(skip_locked=True)
+                .all()
+            )
+            if rows:
+                self._process(db, rows)
+            db.commit()
+            self._update_lag(db)
+            return len(rows)
+        finally:
+            db.close()
+
+    def _process(self, db, rows):
+        # Coalesce: several outbox rows for the same product become one embedding
+        rows_by_product = {}
+        for row in rows:
+            rows_by_product.setdefault(row.product_id, []).append(row)
+        products = db.query(models.Product).filter(models.Product.id.in_(rows_by_product)).all()
+        product_data = {
+            p.id: {
+                "id": p.id,
+                "name": p.name,
+                "description": p.description,
+                "price": p.price,
+                "category": p.category,
+                "stock": p.stock,
+            }
+            for p in products
+        }
+        try:
+            # Already-indexed ids are skipped, and a pending failed save is retried, so replays are safe
+            ai_service.add_products_to_index(list(product_data.values()))
+        except Exception:
+            logger.exception("Failed to index a batch of %d products from outbox, retrying one by one", len(product_data))
+            # Isolate the failure so only the offending products are charged an attempt
+            for product_id, data in product_data.items():
+                try:
+                    ai_service.add_products_to_index([data])
+                except Exception as exc:
+                    logger.exception("Failed to index product %s from outbox", product_id)
+                    self._back_off(rows_by_product.pop(product_id), exc)
+
+        # Remaining rows were indexed, or their product no longer exists
+        for product_rows in rows_by_product.values():
+            for row in product_rows:
+                db.delete(row)
+            OUTBOX_PROCESSED.inc(len(product_rows), result="indexed")
+
+    def _back_off(self, rows, exc):
+        for row in rows:
+            row.attempts += 1
+            row.last_error = str(exc)
+            row.next_attempt_at = func.now() + timedelta(seconds=OUTBOX_BACKOFF_BASE * 2 ** (row.attempts - 1))
+        OUTBOX_PROCESSED.inc(len(rows), result="failed")
+
+    def _update_lag(self, db):
+        due = models.IndexOutbox.attempts < OUTBOX_MAX_ATTEMPTS
+        pending, parked, oldest_age = db.query(
+            func.count(models.IndexOutbox.id).filter(due),
+            func.count(models.IndexOutbox.id).filter(~due),
+            func.extract("epoch", func.now() - func.min(models.IndexOutbox.created_at).filter(due)),
+        ).one()
+        OUTBOX_PENDING.set(pending)
+        OUTBOX_PARKED.set(parked)
+        OUTBOX_LAG.set(float(oldest_age) if oldest_age is not None else 0.0)
+
+
+index_worker = IndexWorker()
@@ -1,19 +1,29 @@
-from fastapi import FastAPI, HTTPException, Depends, status
+import logging
+import time
+
+from fastapi import FastAPI, HTTPException, Depends, Request, status
+from fastapi.responses import JSONResponse, PlainTextResponse
 from fastapi.security import OAuth2PasswordBearer
 
 from database import models, database
-from sqlalchemy.orm import Session
+from sqlalchemy.orm import Session, joinedload
 
 from security import auth
 from fastapi.security import OAuth2PasswordRequestForm
 
 from pydantic import BaseModel
-from datetime import datetime, timedelta
+from datetime import date, datetime, timedelta
 
 from typing import Annotated, List
 from fastapi.middleware.cors import CORSMiddleware
 
 from ai_service import ai_service
+from index_worker import index_worker
+import analytics
+from suggest import suggest_index
+import metrics
+
+logger = logging.getLogger(__name__)
 
 #pydentic schema for creating a product(request body)
 class ProductCreate(BaseModel):
@@ -87,8 +97,43 @@ class OrderResponse(BaseModel):
     class Config:
         from_attributes = True
 
+#Pydantic schemas for sales analytics (read from the rollup tables)
+class ProductSalesResponse(BaseModel):
+    product_id: int
+    units: int
+    revenue: float
+    class Config:
+        from_attributes = True
+
+class CategorySalesResponse(BaseModel):
+    category: str
+    units: int
+    revenue: float
+    class Config:
+        from_attributes = True
+
+class DailySalesResponse(BaseModel):
+    day: date
+    units: int
+    revenue: float
+    class Config:
+        from_attributes = True
+
+#Pydantic schema for typeahead suggestions
+class SuggestionResponse(BaseModel):
+    text: str
+    kind: str # "product" or "category"
+    product_id: int | None = None
+
+# JSON response that times the body encoding, i.e. the real serialization step after the handler returns
+class TimedJSONResponse(JSONResponse):
+    def render(self, content) -> bytes:
+        with metrics.stage("serialize"):
+            return super().render(content)
+
 #Initialize FastAPI app
 app = FastAPI(
+    default_response_class=TimedJSONResponse,
     title="AI-Enahnced E-commerce API",
     description = "Backend for a smart e-commerce",
     version="0.1.0",
@@ -108,11 +153,40 @@ app.add_middleware(
     allow_headers=["*"],  # Allows all headers
 )
 
+# Time every request and record it under its route template (not the raw path, to keep label cardinality low)
+@app.middleware("http")
+async def record_request_metrics(request: Request, call_next):
+    profiler = metrics.start_profiler()
+    start = time.perf_counter()
+    status_code = 500
+    try:
+        response = await call_next(request)
+        status_code = response.status_code
+        return response
+    finally:
+        elapsed = time.perf_counter() - start
+        route = request.scope.get("route")
+        route_path = route.path if route is not None else "unmatched"
+        metrics.REQUEST_LATENCY.observe(elapsed, method=request.method, route=route_path)
+        metrics.REQUEST_COUNT.inc(method=request.method, route=route_path, status=str(status_code))
+        metrics.finish_profiler(profiler, f"{request.method} {route_path}", elapsed)
+
 # Create the database tables when the application starts
 @app.on_event("startup")
 def on_startup():
     database.Base.metadata.create_all(bind=database.engine)
-    print("Database tables created.")
+    metrics.instrument_engine(database.engine)
+    logger.info("Database tables created.")
+    db = database.SessionLocal()
+    try:
+        suggest_index.build(db)
+    finally:
+        db.close()
+    index_worker.start()
+
+@app.on_event("shutdown")
+def on_shutdown():
+    index_worker.stop()
 
 
 # Basic product Model
@@ -136,6 +210,13 @@ def on_startup():
 async def read_root():
     return {"message": "Welcome to the AI-Enhanced E-commerce API!"}
 
+@app.get("/metrics", response_class=PlainTextResponse, include_in_schema=False)
+async def get_metrics():
+    """
+    Expose request, stage and index metrics in the Prometheus text format.
+    """
+    return PlainTextResponse(metrics.registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/products/", response_model=list[ProductResponse])
 async def get_products(skip: int = 0, limit: int= 100,db: Session = Depends(database.get_db)):
     """
@@ -148,6 +229,15 @@ async def get_products(skip: int = 0, limit: int= 100,db: Session = Depends(data
 async def read_users_me(current_user: Annotated[models.User, Depends(auth.get_current_user)]):
     return current_user
 
+# Typeahead endpoint, served entirely from memory (no DB or model call per keystroke).
+# Declared before /products/{product_id} so "suggest" is not parsed as a product id.
+@app.get("/products/suggest", response_model=List[SuggestionResponse])
+async def suggest_products(prefix: str, limit: int = 8):
+    """
+    Suggest product names and categories starting with the given prefix, most popular first.
+    """
+    return suggest_index.suggest(prefix, limit)
+
 #Protected Product Routes (Requies Authentication)
 
 @app.get("/products/{product_id}", response_model=ProductResponse)
@@ -180,7 +270,8 @@ async def search_products(
     similar_products_data = ai_service.search_products(query_text=query, k=limit)
 
     # Convert the dicts back to ProductResponse models for validation/serialization
-    return [ProductResponse(**p) for p in similar_products_data]
+    with metrics.stage("response_build"):
+        return [ProductResponse(**p) for p in similar_products_data]
 
 @app.get("/orders/", response_model=list[OrderResponse])
 async def get_my_orders(
@@ -212,6 +303,56 @@ async def get_order_by_id(
         raise HTTPException(status_code=404, detail="Order not found")
     return order
 
+# Sales analytics, answered from the rollup tables maintained by create_order (see analytics.py)
+@app.get("/analytics/sales/products/", response_model=list[ProductSalesResponse])
+async def get_top_product_sales(
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    limit: int = 10,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Top products by revenue.
+    """
+    return db.query(models.SalesByProduct).order_by(models.SalesByProduct.revenue.desc()).limit(limit).all()
+
+@app.get("/analytics/sales/products/{product_id}", response_model=ProductSalesResponse)
+async def get_product_sales(
+    product_id: int,
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Session = Depends(database.get_db)
+):
+    sales = db.get(models.SalesByProduct, product_id)
+    if sales is None:
+        # Products that exist but were never ordered have no rollup row yet
+        if db.get(models.Product, product_id) is None:
+            raise HTTPException(status_code=404, detail="Product not found")
+        return ProductSalesResponse(product_id=product_id, units=0, revenue=0.0)
+    return sales
+
+@app.get("/analytics/sales/categories/", response_model=list[CategorySalesResponse])
+async def get_category_sales(
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    db: Session = Depends(database.get_db)
+):
+    return db.query(models.SalesByCategory).order_by(models.SalesByCategory.revenue.desc()).all()
+
+@app.get("/analytics/sales/daily/", response_model=list[DailySalesResponse])
+async def get_daily_sales(
+    current_user: Annotated[models.User, Depends(auth.get_current_user)],
+    start: date | None = None,
+    end: date | None = None,
+    db: Session = Depends(database.get_db)
+):
+    """
+    Revenue and units per day, optionally restricted to [start, end].
+    """
+    query = db.query(models.SalesByDay)
+    if start is not None:
+        query = query.filter(models.SalesByDay.day >= start)
+    if end is not None:
+        query = query.filter(models.SalesByDay.day <= end)
+    return query.order_by(models.SalesByDay.day).all()
+
 """
 
 Below is the route using POST method
@@ -230,16 +371,11 @@ async def create_product(
     """
     db_product = models.Product(**product.model_dump())#Create SQLALCHEMY model instance
     db.add(db_product)  # Add the product to the session
+    # Queue the AI index update in the same transaction; the index worker embeds it in the background
+    db.add(models.IndexOutbox(product=db_product))
     db.commit()  # Commit the transaction
     db.refresh(db_product)  # Refresh the instance to get the new ID and other defaults
-    # print("DEBUG: Attempting to add product to AI index...") # Add this debug print
-    # ai_service.add_products_to_index([db_product.__dict__])
-    # print("DEBUG: Finished attempt to add product to AI index.") # Add this debug print
-    product_data_for_ai = ProductResponse.model_validate(db_product).model_dump()
-
-    print("DEBUG: Attempting to add product to AI index...")
-    ai_service.add_products_to_index([product_data_for_ai]) # Pass the clean dict
-    print("DEBUG: Finished attempt to add product to AI index.")
+    suggest_index.add_product(db_product.id, db_product.name, db_product.category)
     return db_product
 
 
@@ -284,6 +420,7 @@ async def create_order(
     # Calculate total amount and store price at purchase
     total_amount = 0.0
     order_items_db = []
+    sold_items = [] # (order item, product) pairs for the sales rollups
 
     for item_data in order.items:
         product = db.query(models.Product).filter(models.Product.id == item_data.product_id).first()
@@ -300,6 +437,7 @@ async def create_order(
             price_at_purchase=price_at_purchase
         )
         order_items_db.append(db_order_item)
+        sold_items.append((db_order_item, product))
 
     db_order = models.Order(
         user_id=current_user.id,
@@ -308,8 +446,13 @@ async def create_order(
     )
     
     db.add(db_order)
+    analytics.record_order(db, sold_items) # Same transaction keeps the rollups consistent with orders
+    # Read before commit, which expires the loaded instances
+    sales = [(product.id, product.category, item.quantity) for item, product in sold_items]
     db.commit()
     db.refresh(db_order)
+    for product_id, category, quantity in sales:
+        suggest_index.record_sale(product_id, category, quantity)
     
     return db_order
 
@@ -0,0 +1,219 @@
+import cProfile
+import io
+import logging
+import os
+import pstats
+import random
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+logger = logging.getLogger(__name__)
+
+#Configuration
+# Default latency buckets in seconds (covers sub-millisecond FAISS lookups up to multi-second encodes)
+DEFAULT_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+# Opt-in profiler: fraction of requests to profile (0 disables it) and the threshold for dumping a profile
+PROFILE_SAMPLE_RATE = float(os.getenv("PROFILE_SAMPLE_RATE", "0"))
+PROFILE_SLOW_MS = float(os.getenv("PROFILE_SLOW_MS", "500"))
+PROFILE_TOP_N = 25
+# Requests share the event loop thread, and on Python 3.11 a second enable() there silently replaces
+# the active profiler, so at most one request is profiled at a time
+_profiler_lock = threading.Lock()
+
+
+def _format_labels(labels: Tuple[Tuple[str, str], ...]) -> str:
+    if not labels:
+        return ""
+    parts = []
+    for key, value in labels:
+        value = str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+        parts.append(f'{key}="{value}"')
+    return "{" + ",".join(parts) + "}"
+
+
+class Counter:
+    """A monotonically increasing value, optionally split by labels."""
+    type_name = "counter"
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._values: Dict[Tuple[Tuple[str, str], ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1.0, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = self._values.get(key, 0.0) + amount
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = list(self._values.items())
+        return [f"{self.name}{_format_labels(key)} {value}" for key, value in items]
+
+
+class Gauge(Counter):
+    """A value that can go up and down (e.g. number of vectors in the index)."""
+    type_name = "gauge"
+
+    def set(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            self._values[key] = float(value)
+
+
+class Histogram:
+    """Cumulative latency histogram, split by labels, rendered in Prometheus format."""
+    type_name = "histogram"
+
+    def __init__(self, name: str, documentation: str, buckets=DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.buckets = tuple(sorted(buckets))
+        # labels -> [per-bucket counts..., +Inf count, sum]
+        self._values: Dict[Tuple[Tuple[str, str], ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(sorted(labels.items()))
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = [0.0] * (len(self.buckets) + 2)
+                self._values[key] = series
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[i] += 1
+                    break
+            else:
+                series[len(self.buckets)] += 1
+            series[-1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def collect(self) -> List[str]:
+        with self._lock:
+            items = [(key, list(series)) for key, series in self._values.items()]
+        lines = []
+        for key, series in items:
+            cumulative = 0.0
+            for bound, count in zip(self.buckets, series):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key + (('le', repr(bound)),))} {cumulative}")
+            cumulative += series[len(self.buckets)]
+            lines.append(f"{self.name}_bucket{_format_labels(key + (('le', '+Inf'),))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {series[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Renders every registered metric in the Prometheus text exposition format."""
+        lines = []
+        for metric in self._metrics:
+            lines.append(f"# HELP {metric.name} {metric.documentation}")
+            lines.append(f"# TYPE {metric.name} {metric.type_name}")
+            lines.extend(metric.collect())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+# HTTP layer
+REQUEST_LATENCY = registry.register(Histogram("http_request_duration_seconds", "HTTP request latency by route."))
+REQUEST_COUNT = registry.register(Counter("http_requests_total", "HTTP requests by route and status code."))
+
+# Per-stage latencies. Request path: encode | faiss_search | metadata_resolve | db_query | response_build | serialize.
+# Background index worker: index_encode | index_save | background_db_query, kept apart so request percentiles stay clean.
+STAGE_LATENCY = registry.register(Histogram("stage_duration_seconds", "Latency of individual request stages."))
+
+# AI index state
+INDEX_SIZE = registry.register(Gauge("faiss_index_size", "Number of vectors in the FAISS index."))
+CACHE_HITS = registry.register(Counter("cache_hits_total", "Cache hits by cache name."))
+CACHE_MISSES = registry.register(Counter("cache_misses_total", "Cache misses by cache name."))
+
+
+_background = threading.local()
+
+
+def stage(name: str):
+    """Context manager timing a named stage into STAGE_LATENCY."""
+    return STAGE_LATENCY.time(stage=name)
+
+
+@contextmanager
+def background():
+    """Marks work on the current thread as background, so its DB queries are not counted as db_query."""
+    _background.active = True
+    try:
+        yield
+    finally:
+        _background.active = False
+
+
+def instrument_engine(engine):
+    """Hooks SQLAlchemy cursor events so every DB statement lands in the db_query stage."""
+    from sqlalchemy import event
+
+    @event.listens_for(engine, "before_cursor_execute")
+    def _before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        conn.info.setdefault("query_start_time", []).append(time.perf_counter())
+
+    @event.listens_for(engine, "after_cursor_execute")
+    def _after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+        start = conn.info["query_start_time"].pop()
+        label = "background_db_query" if getattr(_background, "active", False) else "db_query"
+        STAGE_LATENCY.observe(time.perf_counter() - start, stage=label)
+
+    # after_cursor_execute does not fire for failed statements; drop their start time so
+    # entries don't pile up on the pooled connection
+    @event.listens_for(engine, "handle_error")
+    def _handle_error(context):
+        conn = context.connection
+        if conn is not None and conn.info.get("query_start_time"):
+            conn.info["query_start_time"].pop()
+
+
+def start_profiler():
+    """Returns an enabled profiler for a sampled fraction of requests, or None."""
+    if PROFILE_SAMPLE_RATE <= 0 or random.random() >= PROFILE_SAMPLE_RATE:
+        return None
+    if not _profiler_lock.acquire(blocking=False):
+        return None
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except Exception:
+        _profiler_lock.release()
+        raise
+    return profiler
+
+
+def finish_profiler(profiler, route: str, elapsed: float):
+    """Stops the profiler and logs its top entries if the request was slow."""
+    if profiler is None:
+        return
+    profiler.disable()
+    _profiler_lock.release()
+    # Async handlers share the event loop thread, so the profile may include work from concurrent requests
+    if elapsed * 1000 < PROFILE_SLOW_MS:
+        return
+    out = io.StringIO()
+    pstats.Stats(profiler, stream=out).sort_stats("cumulative").print_stats(PROFILE_TOP_N)
+    logger.warning("Slow request %s took %.1f ms, profile:\n%s", route, elapsed * 1000, out.getvalue())
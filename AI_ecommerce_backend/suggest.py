@@ -0,0 +1,148 @@
+import heapq
+import logging
+from bisect import bisect_left
+from typing import Dict, List, Optional
+
+from sqlalchemy.orm import Session
+
+from database import models
+
+logger = logging.getLogger(__name__)
+
+#Configuration
+MAX_SUGGESTIONS = 20 # upper bound for the limit parameter
+SCAN_LIMIT = 256 # prefix ranges wider than this are served from the memo instead of rescanned
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.casefold().split())
+
+
+class SuggestIndex:
+    """
+    In-memory typeahead over product names and categories.
+
+    Every word-start suffix of a name/category ("wireless earbuds", "earbuds") is kept in a sorted
+    list, so a prefix lookup is two bisects plus a scan of the matching range. Matches are ranked by
+    units sold. Short, common prefixes match wide ranges, so their top results are memoized. Since
+    popularity only grows, an added or re-ranked entry is merged into the affected memos in place.
+    """
+
+    def __init__(self):
+        self._reset()
+
+    def _reset(self):
+        self._keys: List[str] = [] # sorted normalized terms
+        self._refs: List[int] = [] # entry id for each term, parallel to _keys
+        self._entries: List[Dict] = [] # entry id -> {"text", "kind", "product_id", "popularity"}
+        self._entry_terms: List[List[str]] = [] # entry id -> its terms, for memo invalidation
+        self._product_entries: Dict[int, int] = {} # product id -> entry id
+        self._category_entries: Dict[str, int] = {} # category -> entry id
+        self._memo: Dict[str, List[int]] = {}
+
+    def build(self, db: Session):
+        """Loads all products and categories with their sales counts from the rollup tables."""
+        self._reset()
+        product_rows = (
+            db.query(models.Product.id, models.Product.name, models.Product.category, models.SalesByProduct.units)
+            .outerjoin(models.SalesByProduct, models.SalesByProduct.product_id == models.Product.id)
+            .all()
+        )
+        category_units = dict(db.query(models.SalesByCategory.category, models.SalesByCategory.units).all())
+
+        pairs = []
+        for product_id, name, category, units in product_rows:
+            if name:
+                entry_id = self._new_entry(name, "product", product_id, units or 0)
+                self._product_entries[product_id] = entry_id
+                pairs.extend((term, entry_id) for term in self._entry_terms[entry_id])
+            if category and category not in self._category_entries:
+                entry_id = self._new_entry(category, "category", None, category_units.get(category) or 0)
+                self._category_entries[category] = entry_id
+                pairs.extend((term, entry_id) for term in self._entry_terms[entry_id])
+
+        # One sort for the whole catalog instead of an insort per term
+        pairs.sort()
+        self._keys = [term for term, _ in pairs]
+        self._refs = [entry_id for _, entry_id in pairs]
+        # Warm the memo for one-character prefixes, the widest ranges and the first keystroke
+        for first_char in {term[:1] for term in self._keys if term}:
+            self._top(first_char)
+        logger.info("Suggest index built with %d entries and %d terms.", len(self._entries), len(self._keys))
+
+    def add_product(self, product_id: int, name: str, category: Optional[str]):
+        """Adds a newly created product (and its category, if new) to the index."""
+        if name and product_id not in self._product_entries:
+            self._product_entries[product_id] = self._insert(name, "product", product_id)
+        if category and category not in self._category_entries:
+            self._category_entries[category] = self._insert(category, "category", None)
+
+    def record_sale(self, product_id: int, category: Optional[str], quantity: int):
+        """Bumps the popularity of a product and its category after an order."""
+        entry_ids = [self._product_entries.get(product_id), self._category_entries.get(category)]
+        for entry_id in entry_ids:
+            if entry_id is None:
+                continue
+            self._entries[entry_id]["popularity"] += quantity
+            self._promote(entry_id)
+
+    def suggest(self, prefix: str, limit: int = 8) -> List[Dict]:
+        """Returns up to `limit` names/categories with a word starting with `prefix`, most popular first."""
+        prefix = _normalize(prefix)
+        limit = max(0, min(limit, MAX_SUGGESTIONS))
+        if not prefix or not limit:
+            return []
+
+        return [
+            {
+                "text": self._entries[e]["text"],
+                "kind": self._entries[e]["kind"],
+                "product_id": self._entries[e]["product_id"],
+            }
+            for e in self._top(prefix)[:limit]
+        ]
+
+    def _rank(self, entry_id: int):
+        return (self._entries[entry_id]["popularity"], -entry_id)
+
+    def _top(self, prefix: str) -> List[int]:
+        top = self._memo.get(prefix)
+        if top is None:
+            lo = bisect_left(self._keys, prefix)
+            hi = bisect_left(self._keys, prefix + "\uffff", lo)
+            matches = set(self._refs[lo:hi]) # one entry can match through several of its words
+            top = heapq.nlargest(MAX_SUGGESTIONS, matches, key=self._rank)
+            if hi - lo > SCAN_LIMIT:
+                self._memo[prefix] = top
+        return top
+
+    def _new_entry(self, text: str, kind: str, product_id: Optional[int], popularity: int) -> int:
+        words = _normalize(text).split(" ")
+        terms = [" ".join(words[i:]) for i in range(len(words))]
+        self._entries.append({"text": text, "kind": kind, "product_id": product_id, "popularity": popularity})
+        self._entry_terms.append(terms)
+        return len(self._entries) - 1
+
+    def _insert(self, text: str, kind: str, product_id: Optional[int]) -> int:
+        entry_id = self._new_entry(text, kind, product_id, 0)
+        for term in self._entry_terms[entry_id]:
+            pos = bisect_left(self._keys, term)
+            self._keys.insert(pos, term)
+            self._refs.insert(pos, entry_id)
+        self._promote(entry_id)
+        return entry_id
+
+    def _promote(self, entry_id: int):
+        """Merges a new or more popular entry into every memoized prefix it matches."""
+        prefixes = {term[:i] for term in self._entry_terms[entry_id] for i in range(1, len(term) + 1)}
+        for prefix in prefixes:
+            top = self._memo.get(prefix)
+            if top is None:
+                continue
+            # Other entries' ranks are unchanged, so the old top list plus this entry is a complete candidate set
+            candidates = set(top)
+            candidates.add(entry_id)
+            self._memo[prefix] = heapq.nlargest(MAX_SUGGESTIONS, candidates, key=self._rank)
+
+
+suggest_index = SuggestIndex()